@@ -6,71 +6,111 @@ from telegram import Update, Bot
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, ContextTypes
 )
-from trading_logic import start_trading, stop_trading, get_status, log_tax_event, update_anchor_price
+from trading_logic import (
+    BotState, start_trading, stop_trading, get_status, log_tax_event,
+    update_anchor_price, close_exchange
+)
 
 # Load environment variables
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# When set, Telegram pushes updates to this URL instead of the bot
+# long-polling getUpdates (expects a TLS-terminating proxy in front).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
 ANCHOR_REFRESH_INTERVAL = 4 * 60 * 60  # 4 hours in seconds
 
 # Logging setup
-logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 # Shared bot state
-bot_state = {
-    "is_running": False,
-    "last_status": "Idle",
-    "positions": {},
-    "tax_log": [],
-    "anchor_prices": {}
-}
+bot_state = BotState()
+
+# Canonical reply strings, built once instead of inline per handler call.
+REPLY_STARTED = "✅ Trading bot started."
+REPLY_PAUSED = "⏸ Trading bot paused."
+REPLY_RESUMED = "▶️ Trading bot resumed."
+REPLY_ALREADY_RUNNING = "Bot is already running."
+REPLY_TAX_USAGE = "⚠️ Usage: /tax <amount> <reason>"
 
 # Telegram Command Handlers
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    bot_state["is_running"] = True
-    await update.message.reply_text("✅ Trading bot started.")
+    bot_state.is_running = True
+    await update.message.reply_text(REPLY_STARTED)
     await start_trading(bot_state, update, context)
 
 async def pause_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    bot_state["is_running"] = False
-    await update.message.reply_text("⏸ Trading bot paused.")
+    bot_state.is_running = False
+    await update.message.reply_text(REPLY_PAUSED)
     await stop_trading(bot_state)
 
 async def resume_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not bot_state["is_running"]:
-        bot_state["is_running"] = True
-        await update.message.reply_text("▶️ Trading bot resumed.")
+    if not bot_state.is_running:
+        bot_state.is_running = True
+        await update.message.reply_text(REPLY_RESUMED)
         await start_trading(bot_state, update, context)
     else:
-        await update.message.reply_text("Bot is already running.")
+        await update.message.reply_text(REPLY_ALREADY_RUNNING)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status = await get_status(bot_state)
     await update.message.reply_text(f"📊 {status}")
 
 async def tax_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    args = context.args
-    if len(args) < 2:
-        await update.message.reply_text("⚠️ Usage: /tax <amount> <reason>")
+    # Split the raw text once with maxsplit instead of joining the
+    # context.args slice back together.
+    parts = update.message.text.split(maxsplit=2)
+    if len(parts) < 3:
+        await update.message.reply_text(REPLY_TAX_USAGE)
         return
-    amount = args[0]
-    reason = " ".join(args[1:])
+    _, amount, reason = parts
     log_tax_event(bot_state, amount, reason)
     await update.message.reply_text(f"🧾 Logged tax event: ${amount} - {reason}")
 
+# Reused for out-of-band alerts; main() points this at the polling
+# application's own Bot so alerts share its HTTP client and keep-alive
+# connection instead of handshaking per message.
+bot: Bot | None = None
+
 async def send_telegram_message(message: str):
+    global bot
     try:
-        bot = Bot(token=TELEGRAM_TOKEN)
+        if bot is None:
+            bot = Bot(token=TELEGRAM_TOKEN)
         await bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
     except Exception as e:
         logger.error(f"❌ Failed to send Telegram message: {e}")
 
 # Main function
-async def main():
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+async def anchor_refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    await update_anchor_price(bot_state)
+
+def _install_uvloop():
+    # libuv-based event loop; a drop-in speedup for the socket-heavy
+    # Telegram polling + ccxt workload. Optional: unavailable on Windows
+    # and skipped silently if not installed.
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("uvloop installed as event loop policy")
+    except ImportError:
+        pass
+
+async def _post_shutdown(application):
+    # Runs inside the application's own loop during shutdown, so the ccxt
+    # aiohttp session is closed on the loop that owns its connections.
+    await close_exchange()
+
+def build_application():
+    application = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("pause", pause_command))
@@ -80,17 +120,44 @@ async def main():
 
     # Periodic anchor price update
     application.job_queue.run_repeating(
-        lambda ctx: asyncio.create_task(update_anchor_price(bot_state)),
+        anchor_refresh_job,
         interval=ANCHOR_REFRESH_INTERVAL,
         first=0,
     )
+    return application
 
-    try:
-        logger.info("Application started")
-        await application.run_polling()
-    except Exception as e:
-        logger.exception("Unhandled error in main(): %s", str(e))
-        await send_telegram_message(f"🚨 Bot crashed with error:\n{e}")
+# run_polling and run_webhook are blocking sync methods in PTB 22 that drive
+# their own event loop, so both modes run from sync code rather than being
+# awaited inside an already-running loop.
+def run_polling():
+    global bot
+    application = build_application()
+    bot = application.bot
+    logger.info("Application started")
+    application.run_polling()
+
+def run_webhook():
+    global bot
+    application = build_application()
+    bot = application.bot
+    logger.info("Application started (webhook mode)")
+    application.run_webhook(
+        listen="0.0.0.0",
+        port=WEBHOOK_PORT,
+        url_path=TELEGRAM_TOKEN,
+        webhook_url=f"{WEBHOOK_URL}/{TELEGRAM_TOKEN}",
+    )
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    _install_uvloop()
+    try:
+        if WEBHOOK_URL:
+            run_webhook()
+        else:
+            run_polling()
+    except Exception as e:
+        logger.exception("Unhandled error: %s", str(e))
+        # The application's Bot shut down with its loop; send the crash
+        # alert through a fresh client on a fresh loop.
+        bot = None
+        asyncio.run(send_telegram_message(f"🚨 Bot crashed with error:\n{e}"))
\ No newline at end of file
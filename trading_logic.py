@@ -1,7 +1,37 @@
 import asyncio
+import atexit
+import csv
 import logging
-import ccxt
+import ssl
+import time
+import aiohttp
+import ccxt.async_support as ccxt
 import os
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+
+def _fresh_day():
+    return {'date': date.today(), 'pnl': 0.0, 'trades': 0}
+
+
+@dataclass(slots=True)
+class BotState:
+    """Shared state between the Telegram handlers and the trading loop.
+
+    Slotted attributes replace the previous nested dict so the hot loop does
+    fixed-offset attribute loads instead of repeated hashed key lookups.
+    """
+    is_running: bool = False
+    last_status: str = "Idle"
+    positions: dict = field(default_factory=dict)       # symbol -> entry price
+    anchor_price: dict = field(default_factory=dict)    # symbol -> anchor price
+    triggers: dict = field(default_factory=dict)        # symbol -> (dip, rip) prices
+    # Bounded so a long-running bot can't grow this without limit; oldest
+    # entries roll off once the cap is hit.
+    tax_log: deque = field(default_factory=lambda: deque(maxlen=10_000))
+    today: dict = field(default_factory=_fresh_day)     # running daily aggregate
 
 exchange = ccxt.binance({
     'apiKey': os.getenv("API_KEY"),
@@ -9,54 +39,230 @@ exchange = ccxt.binance({
     'enableRateLimit': True
 })
 
-SYMBOLS = os.getenv("SYMBOLS").split(",")
+TRADE_LOG_FILE = os.getenv("TRADE_LOG_FILE", "trades.csv")
+
+# One long-lived, line-buffered handle for the trade log so each trade is a
+# single writerow instead of an open/write/close cycle per event.
+_new_log = not os.path.exists(TRADE_LOG_FILE) or os.path.getsize(TRADE_LOG_FILE) == 0
+_log_fp = open(TRADE_LOG_FILE, 'a', newline='', buffering=1)
+_log_writer = csv.writer(_log_fp)
+atexit.register(_log_fp.close)
+if _new_log:
+    _log_writer.writerow(['timestamp', 'symbol', 'side', 'price', 'amount', 'fee', 'usdt_delta'])
+
+def log_trade(symbol, side, price, amount, fee, usdt_delta):
+    _log_writer.writerow([datetime.now().isoformat(), symbol, side, price, amount, fee, usdt_delta])
+    _log_fp.flush()
+
+def _record_trade(bot_state, usdt_delta):
+    # Running per-day aggregate so the daily summary is O(1) instead of
+    # re-reading the whole trade log.
+    today = bot_state.today
+    today['pnl'] += usdt_delta
+    today['trades'] += 1
+
+def _roll_daily(bot_state):
+    today = bot_state.today
+    if date.today() > today['date']:
+        logging.info("📊 Daily summary %s: %d trades, P&L %.2f USDT", today['date'], today['trades'], today['pnl'])
+        bot_state.today = _fresh_day()
+
+SYMBOLS = tuple(os.getenv("SYMBOLS").split(","))
 INVESTMENT_AMOUNT = float(os.getenv("INVESTMENT_AMOUNT_USD"))
 DIP_THRESHOLD = float(os.getenv("DIP_THRESHOLD_PERCENT")) / 100
 RIP_THRESHOLD = float(os.getenv("RIP_THRESHOLD_PERCENT")) / 100
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL_SECONDS", "5"))
+
+# Short-lived per-symbol price cache so overlapping consumers (trading loop,
+# anchor refresh, status handlers) within one poll cycle share a single
+# upstream fetch instead of hitting the Binance REST API again. The
+# websocket stream writes into the same cache, so while it is connected the
+# REST path below never fires.
+TICKER_CACHE_TTL = 2.0
+_ticker_cache = {}  # symbol -> (price, monotonic timestamp)
+
+BINANCE_WS_URL = "wss://stream.binance.com:9443/ws/!miniTicker@arr"
+_WS_SYMBOLS = {s.replace("/", ""): s for s in SYMBOLS}  # "BTCUSDT" -> "BTC/USDT"
+
+async def ws_price_stream():
+    # One websocket connection carries miniTicker frames for every symbol,
+    # replacing N REST round-trips per poll cycle with pushed updates.
+    # Reconnects with capped exponential backoff.
+    backoff = 1
+    while True:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(BINANCE_WS_URL) as ws:
+                    logging.info("📡 Binance miniTicker stream connected")
+                    backoff = 1
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        now = time.monotonic()
+                        for tick in msg.json():
+                            symbol = _WS_SYMBOLS.get(tick['s'])
+                            if symbol:
+                                _ticker_cache[symbol] = (float(tick['c']), now)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("⚠️ Price stream disconnected: %s", e)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 60)
 
 async def fetch_prices():
-    prices = {}
-    for symbol in SYMBOLS:
-        market = exchange.market(symbol)
-        ticker = exchange.fetch_ticker(symbol)
-        prices[symbol] = ticker['last']
-    return prices
+    # Ensure the tuned session exists before the first exchange call; the
+    # anchor-refresh job fires at startup, and if ccxt's lazy open() wins
+    # that race the default connector sticks for the process lifetime.
+    _open_exchange_session()
+    now = time.monotonic()
+    stale = [s for s in SYMBOLS if now - _ticker_cache.get(s, (0.0, 0.0))[1] >= TICKER_CACHE_TTL]
+    if stale:
+        if exchange.has.get('fetchTickers'):
+            tickers = await exchange.fetch_tickers(stale)
+            for symbol in stale:
+                _ticker_cache[symbol] = (tickers[symbol]['last'], now)
+        else:
+            tickers = await asyncio.gather(*(exchange.fetch_ticker(s) for s in stale))
+            for symbol, ticker in zip(stale, tickers):
+                _ticker_cache[symbol] = (ticker['last'], now)
+    return {symbol: _ticker_cache[symbol][0] for symbol in SYMBOLS}
 
 async def update_anchor_price(bot_state):
     prices = await fetch_prices()
-    bot_state['anchor_price'] = prices
-    logging.info(f"🔁 Anchor prices updated: {prices}")
+    anchors = bot_state.anchor_price
+    triggers = bot_state.triggers
+    # Single pass: write each anchor and its precomputed dip/rip trigger
+    # prices into the existing dicts in place, so the hot loop compares the
+    # live price against two constants and no replacement dicts are built
+    # per refresh.
+    for symbol, price in prices.items():
+        anchors[symbol] = price
+        triggers[symbol] = (price * (1 - DIP_THRESHOLD), price * (1 + RIP_THRESHOLD))
+    logging.info("🔁 Anchor prices updated: %s", anchors)
+
+# Pause/resume gate for the single long-lived trading task. While cleared the
+# loop parks on the event and costs no CPU; setting it wakes the loop at once.
+_running_event = asyncio.Event()
+_trading_task = None
+_ws_task = None
+
+# Set on pause to break out of the poll-interval sleep immediately instead of
+# waiting out the remainder of the interval.
+_wake_event = asyncio.Event()
+
+async def _poll_sleep(seconds):
+    try:
+        await asyncio.wait_for(_wake_event.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+    _wake_event.clear()
+
+def _open_exchange_session():
+    # Mirror of ccxt's lazy Exchange.open(), but with a connector tuned for a
+    # long-lived poller: keep idle connections to api.binance.com warm for
+    # 30s (longer than any sane poll interval) so consecutive cycles reuse
+    # the same TCP+TLS connection instead of re-handshaking.
+    if exchange.session is not None:
+        return
+    exchange.asyncio_loop = asyncio.get_running_loop()
+    exchange.throttler.loop = exchange.asyncio_loop
+    exchange.ssl_context = ssl.create_default_context(cafile=exchange.cafile) if exchange.verify else exchange.verify
+    exchange.tcp_connector = aiohttp.TCPConnector(
+        ssl=exchange.ssl_context,
+        limit=50,
+        keepalive_timeout=30,
+        enable_cleanup_closed=True,
+        loop=exchange.asyncio_loop,
+    )
+    exchange.session = aiohttp.ClientSession(
+        loop=exchange.asyncio_loop,
+        connector=exchange.tcp_connector,
+        trust_env=exchange.aiohttp_trust_env,
+    )
 
 async def start_trading(bot_state, update=None, context=None):
-    bot_state['last_status'] = 'Trading started'
+    global _trading_task, _ws_task
+    bot_state.last_status = 'Trading started'
     logging.info("Trading started")
-    asyncio.create_task(trading_loop(bot_state))
+    _open_exchange_session()
+    # Load markets once up front so the first fetch inside the loop doesn't
+    # pay the lazy /exchangeInfo download and per-call symbol resolution.
+    if not exchange.markets:
+        try:
+            await exchange.load_markets()
+        except Exception as e:
+            logging.warning("⚠️ load_markets failed, will load lazily: %s", e)
+    _running_event.set()
+    if _ws_task is None or _ws_task.done():
+        _ws_task = asyncio.create_task(ws_price_stream())
+    if _trading_task is None or _trading_task.done():
+        _trading_task = asyncio.create_task(trading_loop(bot_state))
 
 async def stop_trading(bot_state):
-    bot_state['last_status'] = 'Trading stopped'
+    bot_state.last_status = 'Trading stopped'
     logging.info("Trading stopped")
+    _running_event.clear()
+    _wake_event.set()
+
+async def close_exchange():
+    # Shut down the ccxt aiohttp session cleanly on process exit.
+    await exchange.close()
 
 async def get_status(bot_state):
-    return f"Status: {bot_state.get('last_status')}\nPositions: {bot_state.get('positions')}\nAnchor: {bot_state.get('anchor_price')}"
+    today = bot_state.today
+    return (f"Status: {bot_state.last_status}\nPositions: {bot_state.positions}\n"
+            f"Anchor: {bot_state.anchor_price}\n"
+            f"Today: {today['trades']} trades, P&L {today['pnl']:.2f} USDT")
 
 def log_tax_event(bot_state, amount, reason):
-    entry = {'amount': amount, 'reason': reason, 'timestamp': asyncio.get_event_loop().time()}
-    bot_state.setdefault('tax_log', []).append(entry)
-    logging.info(f"📜 Tax logged: {entry}")
+    entry = {'amount': amount, 'reason': reason, 'timestamp': time.time()}
+    bot_state.tax_log.append(entry)
+    logging.info("📜 Tax logged: %s", entry)
 
 async def trading_loop(bot_state):
-    while bot_state['is_running']:
-        prices = await fetch_prices()
-        for symbol in SYMBOLS:
-            current = prices[symbol]
-            anchor = bot_state['anchor_price'].get(symbol)
-            if anchor:
-                change = (current - anchor) / anchor
-                if change <= -DIP_THRESHOLD:
-                    logging.info(f"💰 Buying {symbol} at {current} (dip of {change:.2%})")
-                    bot_state['positions'][symbol] = current
-                elif change >= RIP_THRESHOLD and symbol in bot_state['positions']:
-                    entry_price = bot_state['positions'].pop(symbol)
+    backoff = POLL_INTERVAL
+    while True:
+        await _running_event.wait()
+        _roll_daily(bot_state)
+        # One flaky fetch must not kill the loop task; transient errors skip
+        # the cycle, and rate limiting backs off exponentially instead of
+        # hammering the API again next tick.
+        try:
+            prices = await fetch_prices()
+        except ccxt.RateLimitExceeded as e:
+            logging.warning("⚠️ Rate limited, backing off %ds: %s", backoff, e)
+            await _poll_sleep(backoff)
+            backoff = min(backoff * 2, 300)
+            continue
+        except (ccxt.NetworkError, aiohttp.ClientError) as e:
+            logging.warning("⚠️ Price fetch failed, retrying next cycle: %s", e)
+            await _poll_sleep(POLL_INTERVAL)
+            continue
+        backoff = POLL_INTERVAL
+        triggers = bot_state.triggers
+        for symbol, current in prices.items():
+            trigger = triggers.get(symbol)
+            if trigger:
+                dip_trigger, rip_trigger = trigger
+                # Per-tick chatter stays at DEBUG with lazy %-formatting so it
+                # costs nothing at the default level; INFO is trade events only.
+                logging.debug("%s: price=%.4f dip=%.4f rip=%.4f", symbol, current, dip_trigger, rip_trigger)
+                # Only open (and record) a buy when no position is held;
+                # a sustained dip keeps the price under the trigger for many
+                # consecutive ticks and must not write a trade row per tick.
+                if current <= dip_trigger and symbol not in bot_state.positions:
+                    anchor = bot_state.anchor_price[symbol]
+                    change = (current - anchor) / anchor
+                    logging.info("💰 Buying %s at %s (dip of %.2f%%)", symbol, current, change * 100)
+                    bot_state.positions[symbol] = current
+                    log_trade(symbol, 'buy', current, INVESTMENT_AMOUNT / current, 0.0, -INVESTMENT_AMOUNT)
+                    _record_trade(bot_state, -INVESTMENT_AMOUNT)
+                elif current >= rip_trigger and symbol in bot_state.positions:
+                    entry_price = bot_state.positions.pop(symbol)
                     profit = current - entry_price
-                    logging.info(f"💵 Sold {symbol} at {current}, profit: {profit:.2f}")
-        await asyncio.sleep(int(os.getenv("POLL_INTERVAL_SECONDS")))
\ No newline at end of file
+                    logging.info("💵 Sold %s at %s, profit: %.2f", symbol, current, profit)
+                    amount = INVESTMENT_AMOUNT / entry_price
+                    log_trade(symbol, 'sell', current, amount, 0.0, amount * current - INVESTMENT_AMOUNT)
+                    _record_trade(bot_state, amount * current - INVESTMENT_AMOUNT)
+        await _poll_sleep(POLL_INTERVAL)
\ No newline at end of file